@@ -1,15 +1,65 @@
 import json
+import multiprocessing
 import time
-import statistics
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 from datetime import datetime
 
+from benchmark.results import BenchResult, CSV_COLUMNS, SummaryAccumulator
 from logic.formula import Formula
 from walksat.walksat import WalkSAT
 from dpll.dpll import Dpll
 
 
+def load_formula(cnf_file: Path) -> Tuple[Formula, float]:
+    """Load a CNF file, returning the formula and how long it took."""
+
+    start_load = time.perf_counter_ns()
+    instance = Formula.from_dimacs(str(cnf_file))
+    return instance, (time.perf_counter_ns() - start_load) / 1e9
+
+
+def benchmark_file(solver_class, cnf_file: Path, seed: Optional[int] = None,
+                   stop: Optional['multiprocessing.synchronize.Event'] = None,
+                   timestamp: Optional[str] = None, **kwargs) -> BenchResult:
+    """
+    Run a solver on a single CNF file and return metrics.
+
+    Module level (rather than a `BenchmarkRunner` method) so worker processes can run it.
+    `stop` is handed to the solver, which gives up once it is set.
+    `timestamp` is the time the batch started, shared by all of its results (now by default).
+    """
+
+    # Load and transform the formula
+    instance, load_time = load_formula(cnf_file)
+
+    # Solvers preprocess the formula when built (watch lists, simplification), that is solve time too.
+    start_solve = time.perf_counter_ns()
+    solver = solver_class(instance, seed=seed, stop=stop)
+    stats = solver.solve_with_stats(**kwargs)
+    solve_time = (time.perf_counter_ns() - start_solve) / 1e9
+
+    # Compile results
+    return BenchResult(
+        seed=solver.seed,
+        solver=solver_class.__name__,
+        filename=cnf_file.name,
+        variables=instance.num_variables,
+        clauses=len(instance.clauses),
+        solution_found=stats['solution_found'],
+        proved_unsat=stats['proved_unsat'],
+        final_satisfied=stats['final_satisfied'],
+        load_time_seconds=round(load_time, 4),
+        solve_time_seconds=round(solve_time, 4),
+        total_time_seconds=round(load_time + solve_time, 4),
+        solver_params=kwargs,
+        solver_stats=stats,
+        timestamp=timestamp or datetime.now().isoformat()
+    )
+
+
 class BenchmarkRunner:
     """
     Class to run benchmarks of the code.
@@ -31,45 +81,39 @@ class BenchmarkRunner:
 
         return list(self.data_dir.glob("*.cnf"))
 
-    def run_benchmark(self, cnf_file: Path, seed: Optional[int] = None, **kwargs) -> Dict[str, Any]:
-        """Run WalkSAT on a single CNF file and return metrics."""
+    def run_benchmark(self, cnf_file: Path, seed: Optional[int] = None,
+                      timestamp: Optional[str] = None, **kwargs) -> BenchResult:
+        """Run the solver on a single CNF file and return metrics."""
 
         print(f"Benchmarking: {cnf_file.name}")
+        result = benchmark_file(self.solver, cnf_file, seed=seed, timestamp=timestamp, **kwargs)
+        self._print_result(result)
 
-        # Load and transform the formula
-        start_load = time.time()
-        instance = Formula.from_dimacs(str(cnf_file))
-        load_time = time.time() - start_load
-
-        # Solve with WalkSAT
-        solver = self.solver(instance, seed=seed)
-
-        start_solve = time.time()
-        stats = solver.solve_with_stats(**kwargs)
-        solve_time = time.time() - start_solve
-
-        # Compile results
-        result = {
-            'seed': solver.seed,
-            'filename': cnf_file.name,
-            'variables': instance.num_variables,
-            'clauses': len(instance.clauses),
-            'solution_found': stats['solution_found'],
-            'load_time_seconds': round(load_time, 4),
-            'solve_time_seconds': round(solve_time, 4),
-            'total_time_seconds': round(load_time + solve_time, 4),
-            'solver_params': kwargs,
-            'solver_stats': stats,
-            'timestamp': datetime.now().isoformat()
-        }
+        return result
 
-        print(f"  Result: {'SOLVED' if result['solution_found'] else 'UNSOLVED'} "
-              f"in {result['solve_time_seconds']}s ")
+    def _print_result(self, result: BenchResult):
+        status = 'SOLVED' if result.solution_found else 'UNSAT' if result.proved_unsat else 'UNSOLVED'
+        print(f"  Result: {status} "
+              f"in {result.solve_time_seconds}s ")
 
-        return result
+    def run_all_benchmarks(self, max_files: Optional[int] = None, seed: Optional[int] = None,
+                           workers: Optional[int] = None, portfolio: Optional[List[type]] = None,
+                           **solver_kwargs) -> Dict[str, Any]:
+        """
+        Run benchmarks on all CNF files.
 
-    def run_all_benchmarks(self, max_files: Optional[int] = None, seed: Optional[int] = None, **solver_kwargs) -> Dict[str, Any]:
-        """Run benchmarks on all CNF files"""
+        Instances are independent, so they are spread over `workers` processes
+        (all cores by default, `1` runs them serially in this process).
+
+        If `portfolio` is a list of solver classes, every instance is given to all of
+        them at once and the first one to find a solution, or to prove there is none,
+        wins (a "virtual best solver"). The others are then dropped if still queued, or
+        told to stop if running. If none succeeds, the attempt satisfying the most
+        clauses is kept, ties going to the solver listed first.
+
+        Each result is written to the results file as soon as it is ready (see
+        `_save_results`), so memory does not grow with the size of the suite.
+        """
 
         cnf_files = self.find_cnf_files()
         if max_files:
@@ -77,99 +121,136 @@ class BenchmarkRunner:
 
         print(f"Found {len(cnf_files)} CNF files")
 
-        results = []
-        for cnf_file in cnf_files:
-            try:
-                result = self.run_benchmark(cnf_file, **solver_kwargs, seed=seed)
-                results.append(result)
-            except Exception as e:
-                print(f"Error processing {cnf_file.name}: {e}")
-                continue
-
-        # Compute aggregate statistics
-        summary = self._compute_summary(results)
-
-        # Save results
-        output = {
-            'summary': summary,
-            'individual_results': results,
-            'benchmark_config': {
-                'solver_parameters': solver_kwargs,
-                'total_files_processed': len(results),
-                'run_timestamp': datetime.now().isoformat()
-            }
+        # One timestamp for the whole batch, rather than one per instance.
+        timestamp = datetime.now().isoformat()
+        config = {
+            'solver_parameters': solver_kwargs,
+            'run_timestamp': timestamp
         }
 
-        self._save_results(output)
+        results = self._iter_results(cnf_files, seed, workers, portfolio, timestamp, solver_kwargs)
+        summary = self._save_results(results, config, name="portfolio" if portfolio else None)
         self._print_summary(summary)
 
-        return output
-
-    def _compute_summary(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Compute aggregate statistics from individual results."""
-
-        solved = [r for r in results if r['solver_stats']['solution_found']]
-        unsolved = [r for r in results if not r['solver_stats']['solution_found']]
-        total_time = sum(r['total_time_seconds'] for r in results)
-
         return {
-            'total_instances': len(results),
-            'total_time': total_time,
-            'solved_count': len(solved),
-            'unsolved_count': len(unsolved),
-            'success_rate': len(solved) / len(results) if results else 0,
-
-            # Time statistics (only for solved instances)
-            'avg_solve_time_solved': statistics.mean([r['solve_time_seconds'] for r in solved]) if solved else 0,
-            'median_solve_time_solved': statistics.median([r['solve_time_seconds'] for r in solved]) if solved else 0,
-
-            #Time statistics for unsolved
-            'avg_solve_time_unsolved': statistics.mean([r['solve_time_seconds'] for r in unsolved]) if unsolved else 0,
-            'median_solve_time_unsolved': statistics.median([r['solve_time_seconds'] for r in unsolved]) if unsolved else 0,
-            'avg_final_satisfied_unsolved': statistics.mean([r['solver_stats']['final_satisfied'] for r in unsolved]) if unsolved else 0,
+            'summary': summary,
+            'benchmark_config': config
         }
 
-    def _save_results(self, output: Dict[str, Any], format: str = "json"):
-        """Save results to file."""
+    def _iter_results(self, cnf_files: List[Path], seed: Optional[int], workers: Optional[int],
+                      portfolio: Optional[List[type]], timestamp: str,
+                      solver_kwargs: Dict[str, Any]) -> Iterator[BenchResult]:
+        """Yield the result of every instance, in completion order (see `run_all_benchmarks`)."""
+
+        if workers == 1 and not portfolio:
+            for cnf_file in cnf_files:
+                try:
+                    yield self.run_benchmark(cnf_file, **solver_kwargs, seed=seed, timestamp=timestamp)
+                except Exception as e:
+                    print(f"Error processing {cnf_file.name}: {e}")
+            return
+
+        solvers = portfolio or [self.solver]
+
+        # In a portfolio, the solvers of an instance share a stop event, set once one of them
+        # settles it. Manager events, since they are passed along with each job.
+        with (multiprocessing.Manager() if portfolio else nullcontext()) as manager, \
+                ProcessPoolExecutor(max_workers=workers) as executor:
+            stops = {cnf_file: manager.Event() if manager else None for cnf_file in cnf_files}
+            jobs = {}
+            siblings = {cnf_file: [] for cnf_file in cnf_files}
+            for cnf_file in cnf_files:
+                for rank, solver in enumerate(solvers):
+                    job = executor.submit(benchmark_file, solver, cnf_file, seed=seed, stop=stops[cnf_file],
+                                          timestamp=timestamp, **solver_kwargs)
+                    jobs[job] = (cnf_file, rank)
+                    siblings[cnf_file].append(job)
+
+            # The attempt to keep, and its solver's rank, for instances no solver has settled yet.
+            attempts: Dict[Path, Tuple[BenchResult, int]] = {}
+            decided = set()
+            for job in as_completed(jobs):
+                cnf_file, rank = jobs[job]
+                if cnf_file in decided:
+                    continue
+                siblings[cnf_file].remove(job)
+
+                try:
+                    result = job.result()
+                except Exception as e:
+                    print(f"Error processing {cnf_file.name}: {e}")
+                    result = None
+
+                if result is None or not (result.solution_found or result.proved_unsat):
+                    # Keep the attempt satisfying the most clauses, ties going to the solver listed
+                    # first, so which one is kept doesn't depend on which finishes last.
+                    kept = attempts.get(cnf_file)
+                    if result is not None and (
+                        kept is None or (result.final_satisfied, -rank) > (kept[0].final_satisfied, -kept[1])
+                    ):
+                        attempts[cnf_file] = result, rank
+                    if siblings[cnf_file]:
+                        continue
+                    if cnf_file not in attempts:
+                        print(f"No result for {cnf_file.name}, every solver failed.")
+                        continue
+                    result = attempts.pop(cnf_file)[0]
+
+                decided.add(cnf_file)
+                if stops[cnf_file] is not None:
+                    stops[cnf_file].set()
+                for sibling in siblings[cnf_file]:
+                    sibling.cancel()
+                print(f"Benchmarking: {cnf_file.name}")
+                self._print_result(result)
+                yield result
+
+    def _save_results(self, results: Iterable[BenchResult], config: Optional[Dict[str, Any]] = None,
+                      format: str = "jsonl", name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Save results to file as they come, and return their summary.
+
+        With the default JSON Lines format each result is one line, and a last line holds
+        the `summary` and `benchmark_config` (read it back with `read_results`). The CSV
+        format only has the individual results.
+        """
 
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        solver_name = self.solver.__name__.lower()
+        solver_name = name or self.solver.__name__.lower()
         filename = self.results_dir / f"benchmark_{solver_name}_results_{timestamp}.{format}"
 
-        if format == "json":
+        accumulator = SummaryAccumulator()
+
+        if format == "jsonl":
             with open(filename, 'w') as f:
-                json.dump(output, f, indent=2)
+                for result in results:
+                    f.write(json.dumps(result.to_dict()) + "\n")
+                    accumulator.add(result)
+
+                summary = accumulator.summary()
+                config = dict(config or {}, total_files_processed=accumulator.count)
+                f.write(json.dumps({'summary': summary, 'benchmark_config': config}) + "\n")
         elif format == "csv":
-            self._save_as_csv(output, filename)
+            self._save_as_csv(results, accumulator, filename)
+            summary = accumulator.summary()
+        else:
+            raise ValueError(f"Unknown results format: {format}.")
 
         print(f"Results saved to: {filename}")
 
-    def _save_as_csv(self, output: Dict[str, Any], filename: Path):
+        return summary
+
+    def _save_as_csv(self, results: Iterable[BenchResult], accumulator: SummaryAccumulator, filename: Path):
         """Save individual results as CSV for easy analysis."""
 
         import csv
 
         with open(filename, 'w', newline='') as f:
             writer = csv.writer(f)
-            # Header
-            writer.writerow([
-                'filename', 'variables', 'clauses', 'solution_found',
-                'final_satisfied', 'load_time_seconds', 
-                'solve_time_seconds', 'total_time_seconds',  'timestamp'
-            ])
-            # Data
-            for result in output['individual_results']:
-                writer.writerow([
-                    result['filename'],
-                    result['variables'],
-                    result['clauses'],
-                    result['solution_found'],
-                    result['final_satisfied'],
-                    result['load_time_seconds'],
-                    result['solve_time_seconds'],
-                    result['total_time_seconds'],
-                    result['timestamp']
-                ])
+            writer.writerow(CSV_COLUMNS)
+            for result in results:
+                writer.writerow([getattr(result, column) for column in CSV_COLUMNS])
+                accumulator.add(result)
 
     def _print_summary(self, summary: Dict[str, Any]):
         """Print a nice summary to console."""
@@ -182,6 +263,7 @@ class BenchmarkRunner:
         print(f"Total instances: {summary['total_instances']}")
         print(f"Total time: {summary['total_time']}s")
         print(f"Solved: {summary['solved_count']} / {summary['total_instances']}")
+        print(f"Proved UNSAT: {summary['proved_unsat_count']} / {summary['total_instances']}")
         print(f"Success rate: {summary['success_rate']:.1%}")
         print(f"Average solve time (solved): {summary['avg_solve_time_solved']:.4f}s")
         if summary['unsolved_count'] > 0:
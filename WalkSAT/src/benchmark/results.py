@@ -0,0 +1,116 @@
+import json
+import statistics
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Any, Dict, List
+
+
+@dataclass(slots=True, frozen=True)
+class BenchResult:
+    """Metrics of one solver run on one CNF file, as saved to the results file."""
+
+    seed: int
+    solver: str
+    filename: str
+    variables: int
+    clauses: int
+    solution_found: bool
+    proved_unsat: bool
+    final_satisfied: int
+    load_time_seconds: float
+    solve_time_seconds: float
+    total_time_seconds: float
+    solver_params: Dict[str, Any] = field(metadata={'csv': False})
+    solver_stats: Dict[str, Any] = field(metadata={'csv': False})
+    timestamp: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The fields as a dict, in order. Unlike `asdict`, nested dicts are not copied."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+# Columns of the CSV results: every field but the nested dicts.
+CSV_COLUMNS = tuple(f.name for f in fields(BenchResult) if f.metadata.get('csv', True))
+
+
+class SummaryAccumulator:
+    """
+    Running aggregate of benchmark results, fed one result at a time.
+
+    Only the few numbers the summary needs are kept (the solve times, for the
+    medians), never the results themselves, so a suite of any size can be
+    summarized while its results are streamed to disk.
+
+    Instances proven unsatisfiable are counted apart, as `proved_unsat_count`: they
+    are neither solved nor unsolved, so they are left out of the time and
+    `final_satisfied` statistics of both.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_time = 0.0
+        self.solved_times: List[float] = []
+        self.unsolved_times: List[float] = []
+        self.unsolved_satisfied: List[int] = []
+        self.proved_unsat_count = 0
+
+    def add(self, result: BenchResult) -> None:
+        self.count += 1
+        self.total_time += result.total_time_seconds
+        if result.solution_found:
+            self.solved_times.append(result.solve_time_seconds)
+        elif result.proved_unsat:
+            self.proved_unsat_count += 1
+        else:
+            self.unsolved_times.append(result.solve_time_seconds)
+            self.unsolved_satisfied.append(result.final_satisfied)
+
+    def summary(self) -> Dict[str, Any]:
+        solved_times = self.solved_times
+        unsolved_times = self.unsolved_times
+
+        return {
+            'total_instances': self.count,
+            'total_time': self.total_time,
+            'solved_count': len(solved_times),
+            'unsolved_count': len(unsolved_times),
+            'proved_unsat_count': self.proved_unsat_count,
+            'success_rate': len(solved_times) / self.count if self.count else 0,
+
+            # Time statistics (only for solved instances)
+            'avg_solve_time_solved': statistics.fmean(solved_times) if solved_times else 0,
+            'median_solve_time_solved': statistics.median(solved_times) if solved_times else 0,
+
+            #Time statistics for unsolved
+            'avg_solve_time_unsolved': statistics.fmean(unsolved_times) if unsolved_times else 0,
+            'median_solve_time_unsolved': statistics.median(unsolved_times) if unsolved_times else 0,
+            'avg_final_satisfied_unsolved': statistics.fmean(self.unsolved_satisfied) if self.unsolved_satisfied else 0,
+        }
+
+
+def read_results(file) -> Dict[str, Any]:
+    """
+    Read a results file saved by `BenchmarkRunner`.
+
+    Results are written as JSON Lines: one line per instance, then a last line holding
+    the `summary` and `benchmark_config`. Older runs saved a single JSON document with
+    the same keys plus `individual_results`; both come back in that older shape.
+    """
+
+    path = Path(file)
+    text = path.read_text(encoding="utf-8")
+
+    if path.suffix != ".jsonl":
+        return json.loads(text)
+
+    data: Dict[str, Any] = {'individual_results': []}
+    for line in text.splitlines():
+        if not line:
+            continue
+        record = json.loads(line)
+        if 'summary' in record:
+            data.update(record)
+        else:
+            data['individual_results'].append(record)
+
+    return data
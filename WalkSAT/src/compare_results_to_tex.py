@@ -1,11 +1,10 @@
-from pathlib import Path
 import argparse
-import json
+
+from benchmark.results import read_results
 
 
 def read_summary(file):
-  path = Path(file)
-  return json.loads(path.read_text(encoding="utf-8"))['summary']
+  return read_results(file)['summary']
 
 
 parser = argparse.ArgumentParser()
@@ -1,16 +1,71 @@
-from typing import List, Optional
+from array import array
+from collections import deque
+from typing import Deque, List, Optional, Tuple
 from logic.formula import Formula
 from logic.clause import Clause
 from .heuristic import DecisionHeuristic, FirstUnassignedHeuristic, VsidsHeuristic
-import os
+import random
+
+
+def lit_to_idx(literal: int) -> int:
+    """Map a literal to its slot on the watch lists: `2*var` for `var`, `2*var + 1` for `¬var`."""
+    return 2 * abs(literal) + (0 if literal > 0 else 1)
+
 
 class Dpll:
-    def __init__(self, formula: Formula, heuristic: Optional[DecisionHeuristic] = None, seed = None):
+    # How many decisions and conflicts `solve` goes through between looks at the stop event.
+    STOP_CHECK_STEPS = 1024
+
+    def __init__(self, formula: Formula, heuristic: Optional[DecisionHeuristic] = None, seed = None,
+                 stop: Optional['multiprocessing.synchronize.Event'] = None):
         self.formula = formula
-        self.assigns: List[Optional[bool]] = [None] * (formula.num_variables + 1)
+        # 0 = unassigned, 1 = true, 2 = false.
+        self.assigns: bytearray = bytearray(formula.num_variables + 1)
+        # Every assigned variable, in assignment order, so backtracking only undoes what changed.
+        self.trail: List[int] = []
+        # Trail length at the start of each decision level, and whether its decision
+        # is still on the first (true) branch.
+        self.trail_lim: List[int] = []
+        self.decision_phase: List[bool] = []
         self.conflict_clause: Optional[Clause] = None
         self.stats = {}
-        self.seed = seed or int.from_bytes(os.urandom(16), 'big')
+        self.seed = seed if seed is not None else random.getrandbits(64)
+        # Once set (by another process, see `BenchmarkRunner`), `solve` gives up, and `stopped`
+        # tells that apart from a proof that the formula is unsatisfiable.
+        self.stop = stop
+        self.stopped = False
+
+        # Flat (CSR) copy of the clauses, with the variable and sign of each literal alongside,
+        # so the inner loop reads contiguous arrays and skips `abs` and comparisons.
+        # The sign is stored as the value of `assigns` that makes the literal true.
+        self.lits, self.clause_off = formula.to_csr()
+        self.lit_vars: array = array('i', (var for clause in formula.clauses for var in clause.vars))
+        self.lit_signs: bytearray = bytearray(1 if sign else 2 for clause in formula.clauses for sign in clause.signs)
+        self.lit_watch: array = array('i', (lit_to_idx(lit) for lit in self.lits))
+
+        # Two watched literals per clause: `watches[lit_to_idx(l)]` lists the clauses watching `l`,
+        # and `watched[i]` holds the positions (in `lits`) of the two literals clause `i` watches.
+        # Unit and empty clauses are not watched, they are handled once at the root.
+        #
+        # Binary clauses never have a replacement watch, so they skip that machinery: once one
+        # literal is false the other is implied. `implications[lit_to_idx(l)]` lists, for each
+        # binary clause with `l`, the position of the other literal and the clause index.
+        self.watches: List[List[int]] = [[] for _ in range(2 * (formula.num_variables + 1))]
+        self.implications: List[List[Tuple[int, int]]] = [[] for _ in range(2 * (formula.num_variables + 1))]
+        self.watched: List[List[int]] = []
+        for clause_idx in range(len(formula.clauses)):
+            start, end = self.clause_off[clause_idx], self.clause_off[clause_idx + 1]
+            watched = [start, start + 1] if end - start >= 2 else []
+            self.watched.append(watched)
+            if end - start == 2:
+                self.implications[self.lit_watch[start]].append((start + 1, clause_idx))
+                self.implications[self.lit_watch[start + 1]].append((start, clause_idx))
+                continue
+            for k in watched:
+                self.watches[self.lit_watch[k]].append(clause_idx)
+
+        # Literals assigned but not yet propagated.
+        self.prop_queue: Deque[int] = deque()
 
         if heuristic is None:
             self.heuristic = VsidsHeuristic()
@@ -19,78 +74,182 @@ class Dpll:
 
         self.heuristic.initialize(self.formula)
 
+    def value(self, literal: int) -> int:
+        """Value of a literal under the current assignment: 0 if unassigned, 1 if true, 2 if false."""
+        a = self.assigns[abs(literal)]
+        return a if literal > 0 or a == 0 else 3 - a
+
+    def enqueue(self, literal: int) -> bool:
+        """Make `literal` true and schedule it for propagation. Returns False if it is already false."""
+        val = self.value(literal)
+        if val == 0:
+            var = abs(literal)
+            self.assigns[var] = 1 if literal > 0 else 2
+            self.trail.append(var)
+            self.prop_queue.append(literal)
+            return True
+        return val == 1
+
+    def backtrack(self, mark: int) -> None:
+        """Undo every assignment made after the trail had length `mark`."""
+        while len(self.trail) > mark:
+            var = self.trail.pop()
+            self.assigns[var] = 0
+            self.heuristic.unassign(var)
+
+    def assignment(self) -> List[Optional[bool]]:
+        """The current assignment in the `List[Optional[bool]]` form used by `Formula`."""
+        return [None if a == 0 else a == 1 for a in self.assigns]
+
+    def masks(self) -> Tuple[int, int]:
+        """The current assignment as `(true_mask, false_mask)` bitmasks over variables."""
+        true_mask = 0
+        false_mask = 0
+        for var in self.trail:
+            if self.assigns[var] == 1:
+                true_mask |= 1 << var
+            else:
+                false_mask |= 1 << var
+        return true_mask, false_mask
+
     def propagate(self) -> bool:
         self.conflict_clause = None
-        changed = True
-        while changed:
-            changed = False
-            for clause in self.formula.clauses:
-                satisfied = False
-                unassigned_literals = []
-                for lit in clause.literals:
-                    val = self.assigns[abs(lit)]
-                    if val is None:
-                        unassigned_literals.append(lit)
-                    else:
-                        if (lit > 0 and val is True) or (lit < 0 and val is False):
-                            satisfied = True
-                            break
-                if satisfied:
+        # Bind everything the loop touches to locals: attribute lookups dominate otherwise.
+        assigns = self.assigns
+        trail = self.trail
+        queue = self.prop_queue
+        watches = self.watches
+        all_watched = self.watched
+        lits = self.lits
+        clause_off = self.clause_off
+        lit_vars = self.lit_vars
+        lit_signs = self.lit_signs
+        lit_watch = self.lit_watch
+        implications = self.implications
+        while queue:
+            lit = queue.popleft()
+            false_lit = -lit
+            slot = 2 * lit + 1 if lit > 0 else -2 * lit # lit_to_idx(-lit), inlined.
+
+            # Binary clauses first: the other literal is implied right away.
+            for other, clause_idx in implications[slot]:
+                other_val = assigns[lit_vars[other]]
+                if other_val == lit_signs[other]:
                     continue
-                if not unassigned_literals:
-                    self.conflict_clause = clause
+                if other_val != 0:
+                    self.conflict_clause = self.formula.clauses[clause_idx]
+                    queue.clear()
                     return False
-                if len(unassigned_literals) == 1:
-                    literal = unassigned_literals[0]
-                    var = abs(literal)
-                    value = literal > 0
-                    if self.assigns[var] is None:
-                        self.assigns[var] = value
-                        changed = True
+                var = lit_vars[other]
+                assigns[var] = lit_signs[other]
+                trail.append(var)
+                queue.append(lits[other])
+
+            watchers = watches[slot]
+            i = 0
+            num_watchers = len(watchers)
+            while i < num_watchers:
+                clause_idx = watchers[i]
+                watched = all_watched[clause_idx]
+
+                # Keep the falsified watch in the second slot.
+                other = watched[0]
+                if lits[other] == false_lit:
+                    other = watched[1]
+                    watched[1] = watched[0]
+                    watched[0] = other
+                falsified = watched[1]
+
+                # The other watch already satisfies the clause, nothing to do.
+                other_val = assigns[lit_vars[other]]
+                if other_val == lit_signs[other]:
+                    i += 1
+                    continue
+
+                # Look for a literal that is not false to replace the falsified watch.
+                for k in range(clause_off[clause_idx], clause_off[clause_idx + 1]):
+                    if k == other or k == falsified:
+                        continue
+                    val = assigns[lit_vars[k]]
+                    if val == 0 or val == lit_signs[k]:
+                        watched[1] = k
+                        watches[lit_watch[k]].append(clause_idx)
+                        num_watchers -= 1
+                        watchers[i] = watchers[num_watchers]
+                        watchers.pop()
+                        break
+                else:
+                    # Every other literal is false: the clause is unit on `other`, or falsified.
+                    if other_val != 0:
+                        self.conflict_clause = self.formula.clauses[clause_idx]
+                        queue.clear()
+                        return False
+                    var = lit_vars[other]
+                    assigns[var] = lit_signs[other]
+                    trail.append(var)
+                    queue.append(lits[other])
+                    i += 1
         return True
 
     def pick_unassigned(self) -> Optional[int]:
+        # The trail holds every assigned variable once, so its length counts them.
+        if len(self.trail) == self.formula.num_variables:
+            return None
         return self.heuristic.pick_unassigned_variable(self.assigns)
 
-    def dpll(self) -> bool:
-        if not self.propagate():
-            self.heuristic.handle_conflict(self.conflict_clause)
-            return False
-
-        if all(a is not None for a in self.assigns[1:]):
-            return self.formula.is_satisfied(self.assigns)
-
-        var = self.pick_unassigned()
-        if var is None:
-            return self.formula.is_satisfied(self.assigns)
-
-        saved_assigns = self.assigns.copy()
-
-        self.assigns[var] = True
-        if self.dpll():
-            return True
-
-        self.assigns = saved_assigns.copy()
-        self.heuristic.handle_conflict(self.conflict_clause)
-
-        self.assigns[var] = False
-        if self.dpll():
-            return True
+    def solve(self) -> bool:
+        # Unit and empty clauses are not watched, so settle them before searching.
+        for clause in self.formula.clauses:
+            if len(clause) == 0 or (len(clause) == 1 and not self.enqueue(clause.literals[0])):
+                self.conflict_clause = clause
+                return False
+
+        # Pure literals never hurt, fix them before searching too.
+        for literal in self.formula.pure_literals():
+            self.enqueue(literal)
+
+        stop = self.stop
+        check_mask = self.STOP_CHECK_STEPS - 1
+        steps = 0
+        while True:
+            steps += 1
+            if stop is not None and not steps & check_mask and stop.is_set():
+                self.stopped = True
+                return False
+
+            if not self.propagate():
+                self.heuristic.handle_conflict(self.conflict_clause)
+
+                # Drop every level whose both branches failed.
+                while self.trail_lim and not self.decision_phase[-1]:
+                    self.backtrack(self.trail_lim.pop())
+                    self.decision_phase.pop()
+                if not self.trail_lim:
+                    return False
 
-        self.assigns = saved_assigns
-        self.heuristic.handle_conflict(self.conflict_clause)
+                # Retry the innermost decision with the opposite value.
+                var = self.trail[self.trail_lim[-1]]
+                self.backtrack(self.trail_lim[-1])
+                self.decision_phase[-1] = False
+                self.enqueue(-var)
+                continue
 
-        return False
+            var = self.pick_unassigned()
+            if var is None:
+                return self.formula.is_satisfied_mask(*self.masks())
 
-    def solve(self) -> bool:
-        return self.dpll()
+            self.trail_lim.append(len(self.trail))
+            self.decision_phase.append(True)
+            self.enqueue(var)
 
     def solve_with_stats(self, *args, **kwargs) -> dict:
         result = self.solve()
         stats = {
             'solution_found': result,
-            'assignment': self.assigns if result else None,
-            'final_satisfied': int(result)
+            'assignment': self.assignment() if result else None,
+            'final_satisfied': int(result),
+            # The search is complete, so giving up without being stopped is a proof.
+            'proved_unsat': not result and not self.stopped
         }
         self.stats = stats
         return stats
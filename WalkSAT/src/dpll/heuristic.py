@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import List, Optional, Tuple
+import heapq
 
 from logic.formula import Formula
 from logic.clause import Clause
@@ -10,13 +11,18 @@ class DecisionHeuristic(ABC):
         pass
 
     @abstractmethod
-    def pick_unassigned_variable(self, assignments: List[Optional[bool]]) -> Optional[int]:
+    def pick_unassigned_variable(self, assignments: bytearray) -> Optional[int]:
+        """Pick a variable to branch on. `assignments[v] == 0` means `v` is unassigned."""
         pass
 
     @abstractmethod
     def handle_conflict(self, conflict_clause: Clause):
         pass
 
+    def unassign(self, variable: int):
+        """Called when backtracking makes `variable` unassigned again."""
+        pass
+
 
 class FirstUnassignedHeuristic(DecisionHeuristic):
     def __init__(self):
@@ -25,9 +31,9 @@ class FirstUnassignedHeuristic(DecisionHeuristic):
     def initialize(self, formula: Formula):
         self.num_variables = formula.num_variables
 
-    def pick_unassigned_variable(self, assignments: List[Optional[bool]]) -> Optional[int]:
+    def pick_unassigned_variable(self, assignments: bytearray) -> Optional[int]:
         for i in range(1, self.num_variables + 1):
-            if assignments[i] is None:
+            if assignments[i] == 0:
                 return i
         return None
 
@@ -36,39 +42,74 @@ class FirstUnassignedHeuristic(DecisionHeuristic):
 
 
 class VsidsHeuristic(DecisionHeuristic):
+    """
+    VSIDS over a binary max-heap of activity scores, MiniSat style.
+
+    Instead of decaying every score, the bump added on conflicts grows by
+    `1 / decay_factor` every `decay_period` conflicts, which ranks variables the
+    same way. The heap uses lazy deletion: entries whose score is outdated are
+    skipped when popped, and assigned variables are dropped until `unassign`
+    puts them back.
+    """
+
+    RESCALE_LIMIT = 1e100
+
     def __init__(self, decay_factor: float = 0.95, decay_period: int = 256):
         self.scores: List[float] = []
         self.decay_factor = decay_factor
         self.decay_period = decay_period
         self.conflicts_since_decay = 0
         self.num_variables = 0
+        self.bump = 1.0
+        self.heap: List[Tuple[float, int]] = [] # (-score, variable)
+        self.in_heap: bytearray = bytearray()
 
     def initialize(self, formula: Formula):
         self.num_variables = formula.num_variables
         self.scores = [0.0] * (self.num_variables + 1)
         for clause in formula.clauses:
-            for literal in clause.literals:
-                self.scores[abs(literal)] += 1.0
+            for var in clause.vars:
+                self.scores[var] += 1.0
+        self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        self.heap = [(-self.scores[i], i) for i in range(1, self.num_variables + 1)]
+        heapq.heapify(self.heap)
+        self.in_heap = bytearray([0] + [1] * self.num_variables)
 
     def decay_scores(self):
-        for i in range(1, len(self.scores)):
-            self.scores[i] *= self.decay_factor
+        self.bump /= self.decay_factor
+        if self.bump > self.RESCALE_LIMIT:
+            for i in range(1, len(self.scores)):
+                self.scores[i] /= self.RESCALE_LIMIT
+            self.bump /= self.RESCALE_LIMIT
+            self._rebuild_heap()
 
     def handle_conflict(self, conflict_clause: Clause):
         if conflict_clause:
-            for literal in conflict_clause.literals:
-                self.scores[abs(literal)] += 1.0
+            for var in conflict_clause.vars:
+                self.scores[var] += self.bump
+                heapq.heappush(self.heap, (-self.scores[var], var))
+                self.in_heap[var] = 1
             self.conflicts_since_decay += 1
             if self.conflicts_since_decay >= self.decay_period:
                 self.decay_scores()
                 self.conflicts_since_decay = 0
 
-    def pick_unassigned_variable(self, assignments: List[Optional[bool]]) -> Optional[int]:
-        max_score = -1.0
-        best_var = None
-        for i in range(1, self.num_variables + 1):
-            if assignments[i] is None:
-                if self.scores[i] > max_score:
-                    max_score = self.scores[i]
-                    best_var = i
-        return best_var
+    def unassign(self, variable: int):
+        if not self.in_heap[variable]:
+            heapq.heappush(self.heap, (-self.scores[variable], variable))
+            self.in_heap[variable] = 1
+
+    def pick_unassigned_variable(self, assignments: bytearray) -> Optional[int]:
+        heap = self.heap
+        while heap:
+            neg_score, var = heap[0]
+            if -neg_score != self.scores[var]:
+                heapq.heappop(heap) # Outdated entry, a fresher one is in the heap.
+            elif assignments[var] != 0:
+                heapq.heappop(heap)
+                self.in_heap[var] = 0
+            else:
+                return var
+        return None
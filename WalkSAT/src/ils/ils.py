@@ -1,176 +1,205 @@
 from logic.clause import Clause
 from logic.formula import Formula
+from logic.parallel import best_of_runs
+from logic.true_literal_counts import TrueLiteralCounts
 
+from functools import partial
 from typing import List, Optional, Tuple
-import random
 import os
+import random
+
 
 class IteratedLocalSearch:
     """
     Iterated Local Search for MAX-SAT
     Combines local search with perturbation to escape local optima
-    """
 
-    def __init__(self, formula: Formula, seed=None):
-        self.formula = formula
-        # Precompute occurrence lists for performance
-        self.occurrence_lists = self._build_occurrence_lists()
-        self.seed = seed or int.from_bytes(os.urandom(16), 'big')
-        random.seed(self.seed)
+    Assignments are kept as an integer bitmask, bit `i` set when `xi` is true, so
+    flipping a variable is a single xor and copying an assignment is free.
+    """
 
-    def _build_occurrence_lists(self) -> List[List[int]]:
-        """
-        Build lists of clauses where each variable appears.
+    # Defaults for the local search (see `_local_search`). Novelty already steers away
+    # from cycling, so it needs far less random walk than plain WalkSAT's 0.57.
+    NOISE_PROB = 0.05
+    NOVELTY_PROB = 0.5
 
-        It outputs a lookup table `occurence`, where, for some
-        variable index `i`, `ocurrence[i]` is a list of clause indexes (on the formula)
-        where the variable `xi` appear.
+    def __init__(self, formula: Formula, seed=None, verbose: bool = False,
+                 stop: Optional['multiprocessing.synchronize.Event'] = None):
+        self.formula = formula
+        # True literals of each clause under the local search's current state.
+        self.counts = TrueLiteralCounts(formula)
+        # When each variable was last flipped (as a count of flips so far), for Novelty.
+        self.num_flips = 0
+        self.last_flip: List[int] = [0] * (formula.num_variables + 1)
+        self.seed = seed if seed is not None else random.getrandbits(64)
+        # Own generator, so runs don't share (or reseed) the global `random` state.
+        self.rng = random.Random(self.seed)
+        # Report progress from `solve`. Off by default, printing would be timed with the search.
+        self.verbose = verbose
+        # Once set (by another process, see `solve_parallel`), `solve` returns the best it has
+        # after the current local search.
+        self.stop = stop
+
+    def _flip(self, variable: int, state: int) -> int:
+        """Flip a variable, keeping the true literal counts up to date, and return the new state."""
+
+        self.counts.flip(variable, (state >> variable & 1) ^ 1)
+        self.num_flips += 1
+        self.last_flip[variable] = self.num_flips
+
+        return state ^ (1 << variable)
+
+    def _calculate_score(self, variable: int, state: int) -> int:
         """
+        Calculate how many more clauses would be satisfied if we flip a particular
+        variable: the ones it makes (UNSATISFIED ones that become SATISFIED) minus the ones
+        it breaks (SATISFIED ones that become UNSATISFIED).
 
-        # +1 because variables start at index 1
-        occurrence = [[] for _ in range(self.formula.num_variables + 1)]
-
-        for clause_idx, clause in enumerate(self.formula.clauses):
-            for literal in clause.literals:
-                var = abs(literal)
-                occurrence[var].append(clause_idx)
-
-        return occurrence
-
-    def _calculate_break_count(self, variable: int, assignment: List[Optional[bool]]) -> int:
-        """
-        Calculate how many currently SATISFIED clauses would become UNSATISFIED
-        if we flip a particular variable.
+        Both come from the true literal counts, without looking at the clauses themselves: a
+        clause is made when it has no true literal and the variable's literal turns true, and
+        broken when the variable's literal is its only true one.
         """
 
-        break_count = 0
+        score = 0
+        num_true = self.counts.num_true
+        value = state >> variable & 1
+        # The variable's literal is true in the first ones and false in the others.
+        now_true = self.counts.occurrence_lists[variable][value]
+        now_false = self.counts.occurrence_lists[variable][value ^ 1]
 
         # Check all clauses that contain this variable.
         # (Here is where computing the occurrences list is useful!)
-        for clause_idx in self.occurrence_lists[variable]:
-            clause = self.formula.clauses[clause_idx]
-
-            # If clause is currently satisfied...
-            if clause.is_satisfied(assignment):
-                # Check if it would become unsatisfied after flip.
-                temp_assignment = assignment.copy()
-                temp_assignment[variable] = not temp_assignment[variable]
-
-                # If flipping the variable causes the clause to be not satisfied, add to the count.
-                if not clause.is_satisfied(temp_assignment):
-                    break_count += 1
+        for clause_idx in now_false:
+            if num_true[clause_idx] == 0:
+                score += 1
+        for clause_idx in now_true:
+            if num_true[clause_idx] == 1:
+                score -= 1
 
-        return break_count
+        return score
 
-    def _choose_best_variable(self, clause: 'Clause', assignment: List[Optional[bool]]) -> int:
+    def _choose_best_variable(self, clause: 'Clause', state: int, novelty_prob: float) -> int:
         """
-        Choose variable from clause with minimum break count.
+        Choose a variable from the clause with the Novelty heuristic.
 
-        This is a greedy procedure. It selects the variable with the least break count,
-        i.e. the minimum number of unsatisfied clauses under its flipping, and label it
-        as the "best variable to flip".
+        This is a greedy procedure. It ranks the variables by score (see `_calculate_score`),
+        breaking ties in favour of the one flipped longest ago, and picks the best, i.e. the
+        one whose flip maximizes the number of satisfied clauses.
 
-        Effectively, we are greedily selecting the flipping that maximizes the number of
-        satisfied clauses.
+        Except when the best is also the clause's most recently flipped variable: then, with
+        probability `novelty_prob`, the second best is taken instead, so the search doesn't
+        keep undoing its last move. A variable never flipped is no one's last move.
         """
 
-        best_vars = []
-        best_break_count = float('inf')
-
-        for literal in clause.literals:
-            variable = abs(literal)
-            break_count = self._calculate_break_count(variable, assignment) # How many unsat from the flip?
+        last_flip = self.last_flip
+        # Highest score first, then oldest flip first.
+        ranked = sorted(
+            dict.fromkeys(clause.vars),
+            key=lambda variable: (-self._calculate_score(variable, state), last_flip[variable])
+        )
 
-            # Update (or not) the minimum break count and set the variable as the current best.
-            if break_count < best_break_count:
-                best_break_count = break_count
-                best_vars = [variable]
-            elif break_count == best_break_count:
-                best_vars.append(variable) # If the minimum didn't change, add as a tie.
+        best = ranked[0]
+        # Strictly the latest, so it never fires on variables that were never flipped (all 0).
+        if len(ranked) > 1 and last_flip[best] > max(last_flip[variable] for variable in ranked[1:]):
+            if self.rng.random() < novelty_prob:
+                return ranked[1]
 
-        # If there are ties, choose randomly.
-        return random.choice(best_vars)
+        return best
 
     def _local_search(self,
-                      assignment: List[Optional[bool]],
+                      state: int,
                       max_flips: int = 10000,
-                      noise_prob: float = 0.57) -> Tuple[List[Optional[bool]], int]:
+                      noise_prob: float = NOISE_PROB,
+                      novelty_prob: float = NOVELTY_PROB) -> Tuple[int, int]:
         """
-        Perform a local search procedure using WalkSAT algorithm, adapted to our context.
+        Perform a local search procedure using the Novelty+ algorithm, adapted to our context.
         Return the best partial assignment found, with the fitness being the number of clauses satisfied.
 
         Parameters:
             - `max_flips`    : The maximum number of flips allowed per restart.
-            - `max_restarts` : The maximum number of times the algorithm is allowed a fresh restart.
             - `noise_prob`   : Probability of making a random move (walk) vs a greedy move (best).
-                               Defaults to an empirically tested value from the papers.
+            - `novelty_prob` : Probability of the greedy move avoiding the clause's most recently
+                               flipped variable (see `_choose_best_variable`).
 
         Returns:
             Tuple of (best_assignment, best_fitness).
         """
 
-        # Initialize
-        current_assignment = assignment.copy()
-        best_assignment = assignment.copy()
-        best_fitness = self.formula.count_satisfied(assignment)
+        # Looked up once per local search instead of once per flip: ILS runs many short ones.
+        clauses = self.formula.clauses
+        num_clauses = len(clauses)
+        choose_best_variable = self._choose_best_variable
+        flip = self._flip
+        rng = self.rng
+        choice = rng.choice
+        rand = rng.random
+
+        # Initialize. States are ints, so "copies" are just new references.
+        current_state = state
+        best_state = state
+        self.counts.reset(state)
+        unsat = self.counts.unsat # Kept up to date by `flip`.
+        best_fitness = num_clauses - len(unsat)
 
         # Only flip as long as can flip.
         for _ in range(max_flips):
-            # If we found a solution that satisfies the formula, we are done.
-            if self.formula.is_satisfied(current_assignment):
-                return current_assignment, len(self.formula.clauses)
+            # If there is no unsatisfied clause, we found a solution that satisfies the formula, we are done.
+            if not unsat:
+                return current_state, num_clauses
 
-            # Get all unsatisfied clauses and pick one randomly.
-            unsatisfied_clauses = self.formula.get_unsatisfied_clauses(current_assignment)
-            random_clause = random.choice(unsatisfied_clauses)
+            # Pick an unsatisfied clause randomly.
+            random_clause = clauses[choice(unsat)]
 
             # With probability `noise_prob`, do random walk.
-            if random.random() < noise_prob:
+            if rand() < noise_prob:
                 # Flip a random variable from the unsatisfied clause.
-                random_literal = random.choice(random_clause.literals)
-                var_to_flip = abs(random_literal)
+                var_to_flip = choice(random_clause.vars)
             else:
-                # Greedy step: choose the variable with minimal break count.
-                var_to_flip = self._choose_best_variable(random_clause, current_assignment)
+                # Greedy step: choose the variable with the best score, unless it undoes the last move.
+                var_to_flip = choose_best_variable(random_clause, current_state, novelty_prob)
 
             # Flip the chosen variable, wether random or greedy.
-            current_assignment[var_to_flip] = not current_assignment[var_to_flip]
+            current_state = flip(var_to_flip, current_state)
 
             # Track best even if not perfect.
-            current_fitness = self.formula.count_satisfied(current_assignment)
+            current_fitness = num_clauses - len(unsat)
             if current_fitness > best_fitness:
                 best_fitness = current_fitness
-                best_assignment = current_assignment.copy()
+                best_state = current_state
 
-        return best_assignment, best_fitness
+        return best_state, best_fitness
 
-    def _perturbation(self, assignment: List[Optional[bool]], strength: float) -> List[Optional[bool]]:
+    def _perturbation(self, state: int, strength: float) -> int:
         """
         Perturb the current solution by flipping multiple variables.
 
         `strength`: proportion of variables to flip (0.0 to 1.0)
         """
 
-        perturbed = assignment.copy()
         num_flips = max(1, int(self.formula.num_variables * strength))
 
-        variables_to_flip = random.sample(
+        variables_to_flip = self.rng.sample(
             range(1, self.formula.num_variables + 1),
             num_flips
         )
 
+        # Gather every flip in one mask and apply them at once.
+        flip_mask = 0
         for var in variables_to_flip:
-            perturbed[var] = not perturbed[var]
+            flip_mask |= 1 << var
 
-        return perturbed
+        return state ^ flip_mask
 
-    def _generate_initial_solution(self) -> List[Optional[bool]]:
+    def _generate_initial_solution(self) -> int:
         """Generate random initial assignment"""
 
-        assignment: List[Optional[bool]] = [None] * (self.formula.num_variables + 1)
-        for i in range(1, self.formula.num_variables + 1):
-            assignment[i] = random.choice([True, False])
-        return assignment
+        # One random bit per variable, bit 0 is unused.
+        return self.rng.getrandbits(self.formula.num_variables) << 1
+
+    def _to_assignment(self, state: int) -> List[Optional[bool]]:
+        """Expand a state into the `List[Optional[bool]]` form used by `Formula`."""
+
+        return [None] + [bool(state >> var & 1) for var in range(1, self.formula.num_variables + 1)]
 
     def solve(self,
               max_iterations: int = 100,
@@ -189,13 +218,14 @@ class IteratedLocalSearch:
         """
 
         # Generate initial solution
-        current_solution: List[Optional[bool]] = self._generate_initial_solution()
+        current_solution: int = self._generate_initial_solution()
         current_solution, current_fitness = self._local_search(current_solution, local_search_flips)
-        best_solution = current_solution.copy()
+        best_solution = current_solution
         best_fitness = current_fitness
         best_iteration = 1
 
-        print(f"Initial solution: {best_fitness}/{len(self.formula.clauses)} clauses satisfied")
+        if self.verbose:
+            print(f"Initial solution: {best_fitness}/{len(self.formula.clauses)} clauses satisfied")
 
         for iteration in range(max_iterations):
             # Perturbation phase
@@ -207,24 +237,49 @@ class IteratedLocalSearch:
 
             # Update bests if improved the solution, or as per a small probability.
             # Allowing worsening solutions rarely to escape deep local minima.
-            if candidate_fitness >= current_fitness or random.random() < 0.001:
+            if candidate_fitness >= current_fitness or self.rng.random() < 0.001:
                 current_solution = candidate_solution
                 current_fitness = candidate_fitness
 
                 # Update best solution
                 if candidate_fitness > best_fitness:
-                    best_solution = candidate_solution.copy()
+                    best_solution = candidate_solution
                     best_fitness = candidate_fitness
                     best_iteration = iteration
-                    print(f"Iteration {iteration}: New best fitness = {best_fitness}")
+                    if self.verbose:
+                        print(f"Iteration {iteration}: New best fitness = {best_fitness}")
 
             # Early termination if optimal solution found
             if best_fitness == len(self.formula.clauses):
-                print("Optimal solution found!")
+                if self.verbose:
+                    print("Optimal solution found!")
                 break
 
-        print(f"Final solution: {best_fitness}/{len(self.formula.clauses)} clauses satisfied")
-        return best_solution, best_fitness, best_iteration
+            if self.stop is not None and self.stop.is_set():
+                break
+
+        if self.verbose:
+            print(f"Final solution: {best_fitness}/{len(self.formula.clauses)} clauses satisfied")
+        return self._to_assignment(best_solution), best_fitness, best_iteration
+
+    def solve_parallel(self, workers: Optional[int] = None, runs: Optional[int] = None,
+                       **kwargs) -> Tuple[List[Optional[bool]], int, int]:
+        """
+        Run `runs` independent searches (one per worker by default) over `workers` processes
+        (all cores by default), and keep the best.
+
+        Each run is a full `solve` (taking the same `kwargs`) with its own seed, derived from
+        this solver's seed (see `best_of_runs`). As soon as one satisfies every clause the others are told to stop,
+        and it returns without waiting for them.
+        """
+
+        runs = runs or workers or os.cpu_count() or 1
+        num_clauses = len(self.formula.clauses)
+
+        return best_of_runs(
+            partial(IteratedLocalSearch, self.formula), [kwargs] * runs, self.seed, workers,
+            key=lambda result: result[1], done=lambda result: result[1] == num_clauses
+        )
 
     def solve_with_stats(self, *args, **kwargs) -> dict:
       assignment, fitness, best_iteration = self.solve()
@@ -232,6 +287,7 @@ class IteratedLocalSearch:
        'solution_found': (fitness == len(self.formula.clauses)),
        'assignment': assignment,
        'final_satisfied': fitness,
-       'best_iteration': best_iteration
+       'best_iteration': best_iteration,
+       'proved_unsat': False # Local search can't tell.
       }
 
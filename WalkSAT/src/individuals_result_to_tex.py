@@ -1,6 +1,6 @@
-from pathlib import Path
 import argparse
-import json
+
+from benchmark.results import read_results
 
 parser = argparse.ArgumentParser()
 parser.add_argument("input_file")
@@ -22,8 +22,7 @@ rows = ""
 
 
 args = parser.parse_args()
-path = Path(args.input_file)
-data = json.loads(path.read_text(encoding="utf-8"))['individual_results']
+data = read_results(args.input_file)['individual_results']
 
 
 for item in data:
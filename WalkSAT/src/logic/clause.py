@@ -1,7 +1,7 @@
-from typing import List, Optional
-from dataclasses import dataclass
+from typing import Callable, List, Optional, Union
+from dataclasses import dataclass, field
 
-@dataclass
+@dataclass(slots=True)
 class Clause:
     """
     This class represents the clauses and its operations.
@@ -17,38 +17,113 @@ class Clause:
     The example above would be encoded as:
         `[1, 2, -4]`.
     Whatever index doesn't appear is simply not in the clause.
+
+    The clause is also kept as two bitmasks over variables, `pos_mask` with bit `i`
+    set if `xi` appears and `neg_mask` with bit `i` set if `¬xi` appears, so it can be
+    checked against a whole assignment with a couple of integer operations. A complete
+    assignment can itself be given as an int, with bit `i` set when `xi` is true.
     """
 
     literals: List[int]
-
-    def is_satisfied(self, assignment: List[Optional[bool]]) -> bool:
+    # Variable and sign (`True` if positive) of each literal, so hot loops skip `abs` and comparisons.
+    vars: List[int] = field(init=False, repr=False)
+    signs: List[bool] = field(init=False, repr=False)
+    pos_mask: int = field(init=False, repr=False)
+    neg_mask: int = field(init=False, repr=False)
+    # Specialized `is_satisfied`, generated on first use (see `_compile`).
+    _eval: Optional[Callable[[List[Optional[bool]]], bool]] = field(default=None, init=False, repr=False, compare=False)
+    _max_var: int = field(default=0, init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        self.vars = [abs(literal) for literal in self.literals]
+        self.signs = [literal > 0 for literal in self.literals]
+        pos_mask = 0
+        neg_mask = 0
+        for literal in self.literals:
+            if literal > 0:
+                pos_mask |= 1 << literal
+            else:
+                neg_mask |= 1 << -literal
+        self.pos_mask = pos_mask
+        self.neg_mask = neg_mask
+        self._max_var = max(self.vars, default=0)
+
+    def __getstate__(self) -> dict:
+        """Drop the generated `is_satisfied`, lambdas can't be pickled. It is rebuilt on use."""
+
+        state = {name: getattr(self, name) for name in self.__slots__}
+        state['_eval'] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        # Slotted instances have no `__dict__` for pickle to fill in.
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def is_satisfied(self, assignment: Union[List[Optional[bool]], bytearray, int]) -> bool:
         """
         Check if the clause is satisfied under given assignment.
 
         The process is quite simple: since any clause is a disjunction of
         literals, if any of them turns out to be true, then the clause is
         true, hence satisfied.
+
+        The assignment is either indexed by variable, a list of `Optional[bool]` or a
+        `bytearray` of 0/1, or a complete assignment as an int bitmask (see above), which
+        is checked without looping at all.
         """
 
-        for literal in self.literals:
-            # Extract the variable index.
-            var: int = abs(literal)
+        if isinstance(assignment, int):
+            return bool((assignment & self.pos_mask) | (~assignment & self.neg_mask))
 
+        if self._eval is None:
+            self._eval = self._compile()
+
+        # The generated check indexes every variable directly, so it needs a full assignment.
+        if len(assignment) > self._max_var:
+            return self._eval(assignment)
+
+        for var, sign in zip(self.vars, self.signs):
             # Skip if assignment does not cover the current variable.
             if var >= len(assignment) or assignment[var] is None:
                 continue
 
             # Is any of the literals true? Then early return.
-            if (literal > 0 and assignment[var]) or (literal < 0 and not assignment[var]):
+            if assignment[var] == sign:
                 return True
 
         # No literals are true. We had to check them all.
         return False
 
+    def _compile(self) -> Callable[[List[Optional[bool]]], bool]:
+        """
+        Generate a straight-line version of `is_satisfied` for this clause.
+
+        Clauses never change after parsing, so instead of looping over the literals
+        on every check we bake them into an expression, e.g. `[1, 2, -4]` becomes
+            `lambda a: a[1] == 1 or a[2] == 1 or a[4] == 0`.
+        Comparing with 1 and 0 works for `True`/`False`/`None` lists and 0/1 bytes alike.
+        """
+
+        expr = " or ".join(
+            f"a[{abs(literal)}] == {int(literal > 0)}"
+            for literal in self.literals
+        )
+        return eval(f"lambda a: {expr or False}")
+
+    def is_satisfied_mask(self, true_mask: int, false_mask: int) -> bool:
+        """
+        Check if the clause is satisfied by an assignment given as bitmasks.
+
+        Bit `i` of `true_mask` (`false_mask`) is set when `xi` is assigned true (false).
+        """
+
+        return bool((true_mask & self.pos_mask) | (false_mask & self.neg_mask))
+
     def get_variables(self) -> List[int]:
         """Get all variables mentioned in the clause."""
 
-        return [abs(literal) for literal in self.literals]
+        return list(self.vars)
 
     def __len__(self) -> int:
         """Overrides length to reflect the length of the literals list."""
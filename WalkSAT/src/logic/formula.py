@@ -1,20 +1,71 @@
-from typing import List, Optional
+from array import array
+from collections import deque
+from pathlib import Path
+from typing import Deque, List, Optional, Tuple, Union
+import hashlib
+import os
+import pickle
+import re
+import tempfile
 from logic.clause import Clause
-from dataclasses import dataclass
+
+# DIMACS syntax, see `Formula.from_dimacs`.
+_COMMENT = re.compile(r'^[ \t]*c.*$', re.MULTILINE)
+_END = re.compile(r'^[ \t]*%', re.MULTILINE)
+_HEADER = re.compile(r'^[ \t]*p[ \t]+cnf[ \t]+(\d+).*$', re.MULTILINE)
 
 class Formula:
+    # Bump whenever the pickled layout of `Formula`/`Clause` changes, so stale caches get re-parsed.
+    CACHE_VERSION = 6
+
     def __init__(self, num_variables: int) -> None:
         self.num_variables: int = num_variables
         self.clauses: List[Clause] = []
+        self._csr: Optional[Tuple[array, array]] = None
+        self._occurrences: Optional[Tuple[array, array, bytearray]] = None
 
     def add_clause(self, literals: List[int]) -> None:
         """Add a new clause to the formula."""
 
-        if not all(literal != 0 for literal in literals):
+        if 0 in literals:
             raise ValueError("Clause literals cannot be zero.")
         self.clauses.append(Clause(literals))
+        self._csr = None # Flat layout is stale now.
+        self._occurrences = None
+
+    def to_csr(self) -> Tuple[array, array]:
+        """
+        Get the clauses in a flat (CSR) layout, built once and cached.
+
+        Returns `(lits, clause_off)`, two contiguous int arrays where the literals of
+        clause `i` are `lits[clause_off[i]:clause_off[i + 1]]`.
+        """
+
+        if self._csr is None:
+            lits = array('i')
+            clause_off = array('i', [0])
+            for clause in self.clauses:
+                lits.extend(clause.literals)
+                clause_off.append(len(lits))
+            self._csr = (lits, clause_off)
+
+        return self._csr
+
+    def fingerprint(self) -> str:
+        """
+        A hash identifying the formula, whatever the order of its clauses or of their literals.
 
-    def is_satisfied(self, assignment: List[Optional[bool]]) -> bool:
+        Clauses are hashed sorted, each with its literals sorted, along with the number of
+        variables (it sets the size of an assignment).
+        """
+
+        digest = hashlib.blake2b(str(self.num_variables).encode(), digest_size=16)
+        for literals in sorted(sorted(clause.literals) for clause in self.clauses):
+            digest.update(array('i', literals + [0]).tobytes())
+
+        return digest.hexdigest()
+
+    def is_satisfied(self, assignment: Union[List[Optional[bool]], int]) -> bool:
         """
         Check if the formula is satisfied under the given assignment.
 
@@ -27,8 +78,149 @@ class Formula:
             for clause in self.clauses
         )
 
-    def count_satisfied(self, assignment: List[Optional[bool]]) -> int:
-        """Count how many clauses are satisfied under the given assignment."""
+    def is_satisfied_mask(self, true_mask: int, false_mask: int) -> bool:
+        """Check if the formula is satisfied by an assignment given as bitmasks (see `Clause`)."""
+
+        return all(
+            clause.is_satisfied_mask(true_mask, false_mask)
+            for clause in self.clauses
+        )
+
+    def pure_literals(self) -> List[int]:
+        """
+        Get the literals whose variable only ever appears with that sign.
+
+        Setting them true can only satisfy clauses. ORing the clause bitmasks gives every
+        variable seen positive and every variable seen negated, in a handful of big-int ops.
+        """
+
+        pos_seen = 0
+        neg_seen = 0
+        for clause in self.clauses:
+            pos_seen |= clause.pos_mask
+            neg_seen |= clause.neg_mask
+
+        pure: List[int] = []
+        for mask, sign in ((pos_seen & ~neg_seen, 1), (neg_seen & ~pos_seen, -1)):
+            while mask:
+                lowest = mask & -mask
+                pure.append(sign * (lowest.bit_length() - 1))
+                mask ^= lowest
+
+        return pure
+
+    def simplify(self) -> Optional[Tuple['Formula', List[int]]]:
+        """
+        Fix every variable whose value is forced, by unit propagation and pure literals.
+
+        Literals of unit clauses and pure literals are made true, one at a time from a queue:
+        the clauses they satisfy are dropped and their negations are removed from the
+        others, which can make new units and new pure literals, queued in turn. Each clause
+        keeps its number of unassigned literals, and each literal the number of remaining
+        clauses it appears in, so every occurrence is visited a bounded number of times.
+        Variables keep their numbers, forced ones just no longer appear.
+
+        Returns `(reduced, forced)`, the remaining formula (built once, at the end) and the
+        literals made true, or `None` if propagation finds a conflict, i.e. the formula is
+        unsatisfiable.
+        """
+
+        occ_idx, occ_data, occ_sign = self.occurrences()
+        # Per variable, 0 = unassigned, 1 = true, 2 = false (as in `Dpll`).
+        assigns = bytearray(self.num_variables + 1)
+        # The clauses' distinct literals as `(var, sign)`, sign 1 if positive.
+        clause_literals: List[List[Tuple[int, int]]] = []
+        satisfied = bytearray(len(self.clauses))
+        num_free: List[int] = []
+        # Remaining (not yet satisfied) clauses where `xi` appears negated / positive.
+        remaining = [[0, 0] for _ in range(self.num_variables + 1)]
+        queue: Deque[int] = deque()
+
+        for clause_idx, clause in enumerate(self.clauses):
+            literals = [(var, int(sign)) for var, sign in dict.fromkeys(zip(clause.vars, clause.signs))]
+            clause_literals.append(literals)
+            num_free.append(len(literals))
+            if clause.pos_mask & clause.neg_mask:
+                satisfied[clause_idx] = 1 # Has both `xi` and `¬xi`, always satisfied.
+                continue
+            if not literals:
+                return None
+            if len(literals) == 1:
+                queue.append(clause.literals[0])
+            for var, sign in literals:
+                remaining[var][sign] += 1
+
+        for var in range(1, self.num_variables + 1):
+            negated, positive = remaining[var]
+            if positive and not negated:
+                queue.append(var)
+            elif negated and not positive:
+                queue.append(-var)
+
+        forced: List[int] = []
+        while queue:
+            literal = queue.popleft()
+            var = abs(literal)
+            sign = int(literal > 0)
+            if assigns[var]:
+                if assigns[var] == (1 if sign else 2):
+                    continue
+                return None # Forced both ways.
+            assigns[var] = 1 if sign else 2
+            forced.append(literal)
+
+            for k in range(occ_idx[var], occ_idx[var + 1]):
+                clause_idx = occ_data[k]
+                if satisfied[clause_idx]:
+                    continue
+
+                if occ_sign[k] == sign:
+                    # Satisfied: its other literals lose an occurrence, which can make them pure.
+                    satisfied[clause_idx] = 1
+                    for other, other_sign in clause_literals[clause_idx]:
+                        if assigns[other]:
+                            continue
+                        remaining[other][other_sign] -= 1
+                        if not remaining[other][other_sign] and remaining[other][other_sign ^ 1]:
+                            queue.append(other if other_sign ^ 1 else -other)
+                    continue
+
+                # The literal is false now.
+                num_free[clause_idx] -= 1
+                if num_free[clause_idx] == 0:
+                    return None
+                if num_free[clause_idx] == 1:
+                    for other, other_sign in clause_literals[clause_idx]:
+                        if not assigns[other]:
+                            queue.append(other if other_sign else -other)
+                            break
+
+        if not forced:
+            return self, forced
+
+        reduced = Formula(self.num_variables)
+        for clause_idx, literals in enumerate(clause_literals):
+            if not satisfied[clause_idx]:
+                reduced.add_clause([var if sign else -var for var, sign in literals if not assigns[var]])
+
+        return reduced, forced
+
+    def count_satisfied(self, assignment: Union[List[Optional[bool]], int]) -> int:
+        """
+        Count how many clauses are satisfied under the given assignment.
+
+        A complete assignment given as an int bitmask (see `Clause`) is tested against the
+        clause masks right here, with its complement taken once, rather than through a call
+        to `Clause.is_satisfied` per clause.
+        """
+
+        if isinstance(assignment, int):
+            negated = ~assignment
+            return sum(
+                1
+                for clause in self.clauses
+                if assignment & clause.pos_mask or negated & clause.neg_mask
+            )
 
         return sum(
             1
@@ -36,8 +228,16 @@ class Formula:
             if clause.is_satisfied(assignment)
         )
 
-    def get_unsatisfied_clauses(self, assignment: List[Optional[bool]]) -> List[Clause]:
-        """Get all clauses that are left unsatisfied under the given assignment."""
+    def get_unsatisfied_clauses(self, assignment: Union[List[Optional[bool]], int]) -> List[Clause]:
+        """Get all clauses that are left unsatisfied under the given assignment (see `count_satisfied`)."""
+
+        if isinstance(assignment, int):
+            negated = ~assignment
+            return [
+                clause
+                for clause in self.clauses
+                if not (assignment & clause.pos_mask or negated & clause.neg_mask)
+            ]
 
         return [
             clause
@@ -45,8 +245,52 @@ class Formula:
             if not clause.is_satisfied(assignment)
         ]
 
+    def occurrences(self) -> Tuple[array, array, bytearray]:
+        """
+        Get, for each variable, the clauses it appears in, in a flat (CSR) layout, built
+        once and cached.
+
+        Returns `(occ_idx, occ_data, occ_sign)`: for some variable index `i`,
+        `occ_data[occ_idx[i]:occ_idx[i + 1]]` are the clause indexes where `xi` appears,
+        and the same slice of `occ_sign` tells, for each of those clauses, whether `xi`
+        appears positive (1) or negated (0), i.e. the value of `xi` that makes it true.
+
+        Repeated literals are listed once, and clauses with both `xi` and `¬xi` are left
+        out: they are always satisfied, so flips never change them.
+        """
+
+        if self._occurrences is None:
+            literals = [
+                (clause_idx, dict.fromkeys(zip(clause.vars, clause.signs)))
+                for clause_idx, clause in enumerate(self.clauses)
+                if not clause.pos_mask & clause.neg_mask
+            ]
+
+            # First pass: count the occurrences of each variable to find where its slice starts.
+            # +2 because variables start at index 1, and the last one needs an end.
+            occ_idx = array('i', bytes(4 * (self.num_variables + 2)))
+            for _, clause_literals in literals:
+                for var, _ in clause_literals:
+                    occ_idx[var + 1] += 1
+            for var in range(1, self.num_variables + 2):
+                occ_idx[var] += occ_idx[var - 1]
+
+            # Second pass: fill the slices.
+            occ_data = array('i', bytes(4 * occ_idx[-1]))
+            occ_sign = bytearray(occ_idx[-1])
+            fill = occ_idx[:]
+            for clause_idx, clause_literals in literals:
+                for var, sign in clause_literals:
+                    occ_data[fill[var]] = clause_idx
+                    occ_sign[fill[var]] = sign
+                    fill[var] += 1
+
+            self._occurrences = (occ_idx, occ_data, occ_sign)
+
+        return self._occurrences
+
     @classmethod
-    def from_dimacs(cls, filename: str) -> 'Formula':
+    def from_dimacs(cls, filename: str, cache: bool = True) -> 'Formula':
         """
         Class method that reads a DIMACS file and transforms it into a formula instance.
 
@@ -68,51 +312,91 @@ class Formula:
               Each of those lines is ended by a 0.
 
               For example, a line `1 2 -4 0` represents the clause `x1 ∨ x2 ∨ ¬x4`.
+
+        Parsing is the whole load time, so unless `cache` is False the parsed formula is
+        pickled next to the file (`file.cnf.pkl`) and reused while it is newer than the file.
         """
 
-        formula: Optional[Formula] = None
+        if not cache:
+            return cls._parse_dimacs(filename)
 
-        with open(filename, 'r') as f:
-            for line in f:
-                line = line.strip() # Remove any possible trailing whitespace.
+        path = Path(filename)
+        cache_path = path.with_suffix(path.suffix + '.pkl')
 
-                # If it's a comment, skip.
-                if line.startswith('c') or not line:
-                    continue
+        try:
+            if cache_path.stat().st_mtime >= path.stat().st_mtime:
+                with open(cache_path, 'rb') as f:
+                    version, formula = pickle.load(f)
+                if version == cls.CACHE_VERSION:
+                    return formula
+        except Exception:
+            pass # Missing, unreadable or corrupt (unpickling raises all sorts), parse it again.
 
-                # Reached end of file, nothing more to see.
-                if line.startswith('%'):
-                    break
+        formula = cls._parse_dimacs(filename)
 
-                # When the header is found, capture the number of variables and start a Formula object.
-                if line.startswith('p cnf'):
-                    parts: List[str] = line.split()
-                    num_vars: int = int(parts[2])
-                    formula = cls(num_vars) # A new formula with `num_vars` variables.
-                    continue
+        # Written aside and renamed into place, so processes loading the same file at once
+        # (see `BenchmarkRunner`) never read a half-written cache, nor interleave their writes.
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=cache_path.parent, prefix=cache_path.name, suffix='.tmp')
+        except OSError:
+            return formula # Read-only data directory, just don't cache.
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((cls.CACHE_VERSION, formula), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass # Out of space or the like, just don't cache.
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
 
-                # If the first non-comment line is not the file header, flag an error.
-                if formula is None:
-                    raise ValueError(f"Error on {filename}:\nFile must have with the `p cnf` header.")
+        return formula
 
-                # Get the line and transform in a list of integers.
-                literals: List[int] = list(map(int, line.split()))
+    @classmethod
+    def _parse_dimacs(cls, filename: str) -> 'Formula':
+        """
+        Parse a DIMACS file (see `from_dimacs`).
 
-                # Remove the trailing 0.
-                if literals[-1] == 0:
-                    literals = literals[:-1]
+        Rather than splitting and converting line by line, the whole file is read at once,
+        only the header is located with a regex, and the clauses are converted to ints in
+        a single `split` and `map(int, ...)`, then cut on their `0` terminators.
+        """
 
-                if literals and not all(
-                    1 <= abs(lit) <= formula.num_variables
-                    for lit in literals
-                ):
-                    raise ValueError(f"Error on {filename}:\nVariables out of bounds [1, {formula.num_variables}].")
+        with open(filename, 'r') as f:
+            text = f.read()
 
-                # Add literals as a clause in the formula.
-                formula.add_clause(literals)
+        # Drop comments (lines starting with `c`), and everything from the end marker `%` on.
+        text = _COMMENT.sub('', text)
+        end = _END.search(text)
+        if end:
+            text = text[:end.start()]
 
-        # Safety check
-        if formula is None:
+        # The header holds the number of variables, and must come before any clause.
+        header = _HEADER.search(text)
+        if header is None:
+            if text.strip():
+                raise ValueError(f"Error on {filename}:\nFile must have with the `p cnf` header.")
             raise ValueError(f"Error on {filename}:\nNo valid SAT Formula found in file.")
+        if text[:header.start()].strip():
+            raise ValueError(f"Error on {filename}:\nFile must have with the `p cnf` header.")
+
+        formula = cls(int(header.group(1))) # A new formula with `num_vars` variables.
+
+        # Every literal of every clause, and their 0 terminators.
+        tokens: List[int] = list(map(int, text[header.end():].split()))
+
+        if tokens and (max(tokens) > formula.num_variables or -min(tokens) > formula.num_variables):
+            raise ValueError(f"Error on {filename}:\nVariables out of bounds [1, {formula.num_variables}].")
+
+        start = 0
+        while start < len(tokens):
+            try:
+                end = tokens.index(0, start)
+            except ValueError:
+                end = len(tokens) # A last clause without its 0 is kept too.
+
+            # Add literals as a clause in the formula.
+            formula.add_clause(tokens[start:end])
+            start = end + 1
 
         return formula
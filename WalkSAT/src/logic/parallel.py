@@ -0,0 +1,57 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, List, Optional, TypeVar
+import multiprocessing
+import random
+
+Result = TypeVar('Result')
+
+# The stop event of `best_of_runs`, in each of its worker processes (see `_init_worker`).
+_stop: Optional['multiprocessing.synchronize.Event'] = None
+
+def _init_worker(stop: 'multiprocessing.synchronize.Event') -> None:
+    """Keep the stop event in a worker process. It can't be pickled along with each job."""
+
+    global _stop
+    _stop = stop
+
+def _run(factory: Callable[..., Any], seed: int, kwargs: dict) -> Any:
+    """Build a solver and run it. Module level so worker processes can run it."""
+
+    return factory(seed=seed, stop=_stop).solve(**kwargs)
+
+
+def best_of_runs(factory: Callable[..., Any], runs: List[dict], seed: int, workers: Optional[int],
+                 key: Callable[[Result], Any], done: Callable[[Result], bool]) -> Optional[Result]:
+    """
+    Run independent searches over `workers` processes (all cores by default), and keep the best.
+
+    Each of `runs` is the `kwargs` of one `factory(seed=..., stop=...).solve(**kwargs)`, with
+    its own seed drawn from a generator seeded with `seed`. Drawn rather than `seed + run`, so
+    the runs of neighbouring seeds don't repeat each other's searches. `factory` is pickled to
+    the workers, so it is a solver class, or a `functools.partial` of one with its formula.
+
+    Results are ranked by `key`, the first to come wins ties. As soon as one is `done`,
+    the runs still queued are dropped and the running ones are told to stop, through the
+    `stop` event every solver is built with, and it returns without waiting for them.
+    Returns None if there are no runs.
+    """
+
+    seeds = random.Random(seed)
+    stop = multiprocessing.Event()
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(stop,))
+    try:
+        jobs = [executor.submit(_run, factory, seeds.getrandbits(64), kwargs) for kwargs in runs]
+
+        best: Optional[Result] = None
+        for job in as_completed(jobs):
+            result = job.result()
+            if best is None or key(result) > key(best):
+                best = result
+            if done(best):
+                break
+    finally:
+        stop.set()
+        # Don't wait for the others to notice.
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return best
@@ -0,0 +1,87 @@
+from typing import List, Tuple
+from logic.formula import Formula
+
+class TrueLiteralCounts:
+    """
+    Number of true literals of each clause of a formula, kept up to date while an
+    assignment changes one flip at a time, as in local search.
+
+    Along with `num_true`, it keeps the clauses with no true literal in `unsat` (in no
+    particular order), and where each of those is in `unsat` in `unsat_pos` (-1 for the
+    satisfied ones), so both adding and removing one is O(1). Picking a random unsatisfied
+    clause is then a single draw of an index into `unsat`: no clause is scanned, and no
+    list is built, per flip.
+    """
+
+    def __init__(self, formula: Formula) -> None:
+        self.formula = formula
+        # Precompute occurrence lists for performance
+        self.occurrence_lists = self._build_occurrence_lists()
+        self.num_true: List[int] = []
+        self.unsat: List[int] = []
+        self.unsat_pos: List[int] = []
+
+    def _build_occurrence_lists(self) -> List[Tuple[List[int], List[int]]]:
+        """
+        Build lists of clauses where each variable appears, split by the literal's sign.
+
+        It outputs a lookup table `occurence`, where, for some variable index `i`,
+        `ocurrence[i][1]` lists the clause indexes (on the formula) where `xi` appears
+        positive and `ocurrence[i][0]` those where it appears negated. That is, indexed by
+        a value of `xi`, the clauses where that value makes its literal true, so the hot
+        loops pick the right list once instead of testing the sign of every occurrence.
+
+        It is read off `Formula.occurrences`, so repeated literals and clauses with both
+        `xi` and `¬xi` are left out.
+        """
+
+        occ_idx, occ_data, occ_sign = self.formula.occurrences()
+        # +1 because variables start at index 1
+        occurrence = [([], []) for _ in range(self.formula.num_variables + 1)]
+
+        for var in range(1, self.formula.num_variables + 1):
+            for k in range(occ_idx[var], occ_idx[var + 1]):
+                occurrence[var][occ_sign[k]].append(occ_data[k])
+
+        return occurrence
+
+    def reset(self, state: int) -> None:
+        """
+        Count from scratch for a complete assignment given as an int bitmask (see `Clause`),
+        popcounting the clause masks.
+        """
+
+        self.num_true = [
+            (state & clause.pos_mask).bit_count() + (~state & clause.neg_mask).bit_count()
+            for clause in self.formula.clauses
+        ]
+        self.unsat = [clause_idx for clause_idx, count in enumerate(self.num_true) if count == 0]
+        self.unsat_pos = [-1] * len(self.num_true)
+        for pos, clause_idx in enumerate(self.unsat):
+            self.unsat_pos[clause_idx] = pos
+
+    def flip(self, variable: int, value: int) -> None:
+        """Update the counts for `variable` having been flipped, `value` (0/1) being its new value."""
+
+        num_true = self.num_true
+        unsat = self.unsat
+        unsat_pos = self.unsat_pos
+        # Literals that were false turn true, and the other way around.
+        made = self.occurrence_lists[variable][value]
+        broken = self.occurrence_lists[variable][value ^ 1]
+        for clause_idx in made:
+            num_true[clause_idx] += 1
+            if num_true[clause_idx] == 1:
+                # Made: move the last unsatisfied clause into its place.
+                pos = unsat_pos[clause_idx]
+                last = unsat.pop()
+                if last != clause_idx:
+                    unsat[pos] = last
+                    unsat_pos[last] = pos
+                unsat_pos[clause_idx] = -1
+        for clause_idx in broken:
+            num_true[clause_idx] -= 1
+            if num_true[clause_idx] == 0:
+                # Broken.
+                unsat_pos[clause_idx] = len(unsat)
+                unsat.append(clause_idx)
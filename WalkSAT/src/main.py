@@ -12,8 +12,8 @@ SOLVERS = {
     "ils": IteratedLocalSearch
 }
 
-def main(solver_class, data_path, seed=None):
-    print(f"Running benchmarks using solver: {solver_class.__name__}")
+def main(solver_class, data_path, seed=None, workers=None, portfolio=False):
+    print(f"Running benchmarks using solver: {'portfolio' if portfolio else solver_class.__name__}")
 
     runner = BenchmarkRunner(solver_class, data_dir=data_path)
 
@@ -23,7 +23,9 @@ def main(solver_class, data_path, seed=None):
             max_flips=5000,
             max_restarts=50,
             noise_prob=0.57,
-            seed=seed
+            seed=seed,
+            workers=workers,
+            portfolio=[WalkSAT, Dpll] if portfolio else None
         )
     elif os.path.isfile(data_path) and data_path.endswith(".cnf"):
         print(f"Detected CNF file: {data_path}. Running single benchmark...")
@@ -34,8 +36,7 @@ def main(solver_class, data_path, seed=None):
             noise_prob=0.57,
             seed=seed
         )]
-        summary = runner._compute_summary(results)
-        runner._save_results(results)
+        summary = runner._save_results(results)
         runner._print_summary(summary)
 
     else:
@@ -68,9 +69,22 @@ if __name__ == "__main__":
         help="Random seed for reproducibility"
     )
 
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of processes to run instances on (default: all cores, 1 runs serially)"
+    )
+
+    parser.add_argument(
+        "--portfolio",
+        action="store_true",
+        help="Run WalkSAT and DPLL on every instance, keeping whichever solves it first"
+    )
+
 
     args = parser.parse_args()
     
     solver_class = SOLVERS[args.solver.lower()]
     
-    main(solver_class, args.data, seed=args.seed)
+    main(solver_class, args.data, seed=args.seed, workers=args.workers, portfolio=args.portfolio)
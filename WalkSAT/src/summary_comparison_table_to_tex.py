@@ -1,14 +1,15 @@
 import argparse
-import json
 from pathlib import Path
 
+from benchmark.results import read_results
+
 def read_individual_results(file_path):
     """Lê a chave 'individual_results' de um arquivo JSON."""
     path = Path(file_path)
     if not path.exists():
         print(f"Erro: Arquivo não encontrado {file_path}")
         exit(1)
-    data = json.loads(path.read_text(encoding="utf-8"))
+    data = read_results(path)
     return data.get('individual_results', [])
 
 def format_value(value, is_bool=False, is_float=False):
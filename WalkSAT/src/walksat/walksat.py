@@ -1,9 +1,19 @@
 from logic.clause import Clause
 from logic.formula import Formula
+from logic.parallel import best_of_runs
+from logic.true_literal_counts import TrueLiteralCounts
 
+from functools import partial
+from pathlib import Path
 from typing import List, Optional, Tuple
-import random
 import os
+import random
+import sys
+
+# Turn the 0/1 bytes of an assignment into the digits of its bitmask and back,
+# see `WalkSAT._to_mask` and `WalkSAT._random_assignment`.
+_BITS = bytes.maketrans(b'\x00\x01', b'01')
+_BYTES = bytes.maketrans(b'01', b'\x00\x01')
 
 class WalkSAT:
     """
@@ -22,59 +32,131 @@ class WalkSAT:
     random assignment.
     """
 
-    def __init__(self, formula: Formula, seed=None):
+    # Where solutions are kept across runs when `cache` is on, one file per formula.
+    CACHE_DIR = Path('~/.cache/walksat')
+
+    # How many flips `_walk` makes between looks at the stop event.
+    STOP_CHECK_FLIPS = 1024
+
+    def __init__(self, formula: Formula, seed=None, cache: bool = False,
+                 stop: Optional['multiprocessing.synchronize.Event'] = None):
         self.formula = formula
-        # Precompute occurrence lists for performance
-        self.occurrence_lists = self._build_occurrence_lists()
-        self.seed = seed or int.from_bytes(os.urandom(16), 'big')
+        # The search runs on what is left once forced variables are fixed (see `Formula.simplify`),
+        # their values are set on every assignment. If that already proves the formula
+        # unsatisfiable there is nothing to search for, every `solve` gives up right away.
+        simplified = formula.simplify()
+        self.unsatisfiable = simplified is None
+        self.reduced, self.forced = simplified or (formula, [])
+        # Reuse (and keep) solutions from earlier runs on the same formula, see `_load_solution`.
+        self.cache = cache
+        # True literals of each clause of the reduced formula under the current assignment.
+        self.counts = TrueLiteralCounts(self.reduced)
+        self.seed = seed if seed is not None else random.getrandbits(64)
         self.stats = {}
-        random.seed(self.seed)
+        # Every draw comes from here, so a run is replayed by its seed alone.
+        self.rng = random.Random(self.seed)
+        # Once set (by another process, see `solve_parallel`), the search gives up where it is.
+        self.stop = stop
 
-    def _build_occurrence_lists(self) -> List[List[int]]:
+    def _stopped(self) -> bool:
+        """Whether the stop event is set, see `__init__`."""
+        return self.stop is not None and self.stop.is_set()
+
+    def _cache_path(self) -> Path:
+        """Where the solution for this formula is stored (see `_load_solution`)."""
+        return self.CACHE_DIR.expanduser() / f"{self.formula.fingerprint()}.bin"
+
+    def _load_solution(self) -> Optional[List[Optional[bool]]]:
         """
-        Build lists of clauses where each variable appears.
+        Get the solution stored by an earlier run on the same formula, if `cache` is on.
 
-        It outputs a lookup table `occurence`, where, for some
-        variable index `i`, `ocurrence[i]` is a list of clause indexes (on the formula)
-        where the variable `xi` appear.
+        Solutions are stored as one byte per variable (index 0 unused), 1 for true and 0
+        for false, and named after `Formula.fingerprint`. A stored solution is only used
+        if it still satisfies the formula.
         """
 
-        # +1 because variables start at index 1
-        occurrence = [[] for _ in range(self.formula.num_variables + 1)]
+        if not self.cache:
+            return None
+
+        try:
+            stored = self._cache_path().read_bytes()
+        except OSError:
+            return None # Never solved, or unreadable.
+
+        if len(stored) != self.formula.num_variables + 1 or stored.translate(None, b'\x00\x01'):
+            return None
+        assignment = self._to_list(bytearray(stored))
 
-        for clause_idx, clause in enumerate(self.formula.clauses):
-            for literal in clause.literals:
-                var = abs(literal)
-                occurrence[var].append(clause_idx)
+        return assignment if self.formula.is_satisfied(assignment) else None
 
-        return occurrence
+    def _save_solution(self, assignment: List[Optional[bool]]) -> None:
+        """Store a solution for later runs (see `_load_solution`), if `cache` is on."""
 
-    def _calculate_break_count(self, variable: int, assignment: List[Optional[bool]]) -> int:
+        if not self.cache:
+            return
+
+        try:
+            path = self._cache_path()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(bytes(value is True for value in assignment))
+        except OSError:
+            pass # Read-only home, just don't cache.
+
+    def _random_assignment(self) -> bytearray:
+        """
+        Generate a random complete assignment.
+
+        It is a `bytearray` indexed by variable holding 1 (true) or 0 (false), so flipping
+        is a single `^= 1` on a byte instead of building a new bool. Index 0 is unused.
+
+        All the values come from a single draw of random bits, rather than one per variable,
+        except for the forced variables (see `Formula.simplify`), which get their forced value.
+        """
+
+        num_variables = self.formula.num_variables
+        state = self.rng.getrandbits(num_variables) << 1 # Bit 0 is unused.
+        assignment = bytearray(format(state, f'0{num_variables + 1}b')[::-1].encode()).translate(_BYTES)
+        for literal in self.forced:
+            assignment[abs(literal)] = literal > 0
+        return assignment
+
+    @staticmethod
+    def _to_list(assignment: bytearray) -> List[Optional[bool]]:
+        """The assignment in the `List[Optional[bool]]` form used by `Formula`."""
+        return [None] + [value == 1 for value in assignment[1:]]
+
+    @staticmethod
+    def _to_mask(assignment: bytearray) -> int:
+        """The assignment as an int bitmask, bit `i` set when `xi` is true (see `Clause`)."""
+        return int(assignment[::-1].translate(_BITS), 2)
+
+    def _calculate_break_count(self, variable: int, assignment: bytearray,
+                               threshold: int = sys.maxsize) -> int:
         """
         Calculate how many currently SATISFIED clauses would become UNSATISFIED
         if we flip a particular variable.
+
+        It comes from the true literal counts, without looking at the clauses themselves: a clause
+        breaks when the variable's literal, true now, is its only true one.
+
+        The scan stops as soon as the count goes over `threshold`, returning that partial
+        count: callers looking for a minimum don't care how much worse it is.
         """
 
         break_count = 0
+        num_true = self.counts.num_true
 
-        # Check all clauses that contain this variable.
+        # Check all clauses where this variable's literal is true.
         # (Here is where computing the occurrences list is useful!)
-        for clause_idx in self.occurrence_lists[variable]:
-            clause = self.formula.clauses[clause_idx]
-
-            # If clause is currently satisfied...
-            if clause.is_satisfied(assignment):
-                # Check if it would become unsatisfied after flip.
-                temp_assignment = assignment.copy()
-                temp_assignment[variable] = not temp_assignment[variable]
-
-                # If flipping the variable causes the clause to be not satisfied, add to the count.
-                if not clause.is_satisfied(temp_assignment):
-                    break_count += 1
+        for clause_idx in self.counts.occurrence_lists[variable][assignment[variable]]:
+            if num_true[clause_idx] == 1:
+                break_count += 1
+                if break_count > threshold:
+                    break
 
         return break_count
 
-    def _choose_best_variable(self, clause: 'Clause', assignment: List[Optional[bool]]) -> int:
+    def _choose_best_variable(self, clause: 'Clause', assignment: bytearray) -> int:
         """
         Choose variable from clause with minimum break count.
 
@@ -86,12 +168,13 @@ class WalkSAT:
         satisfied clauses.
         """
 
+        calculate_break_count = self._calculate_break_count
         best_vars = []
-        best_break_count = float('inf')
+        best_break_count = sys.maxsize # An int, so comparisons stay int-to-int.
 
-        for literal in clause.literals:
-            variable = abs(literal)
-            break_count = self._calculate_break_count(variable, assignment) # How many unsat from the flip?
+        for variable in clause.vars:
+            # How many unsat from the flip? Past the best so far, the exact number doesn't matter.
+            break_count = calculate_break_count(variable, assignment, best_break_count)
 
             # Update (or not) the minimum break count and set the variable as the current best.
             if break_count < best_break_count:
@@ -101,7 +184,56 @@ class WalkSAT:
                 best_vars.append(variable) # If the minimum didn't change, add as a tie.
 
         # If there are ties, choose randomly.
-        return random.choice(best_vars)
+        return best_vars[int(self.rng.random() * len(best_vars))]
+
+    def _walk(self, assignment: bytearray, max_flips: int, noise_prob: float) -> Optional[int]:
+        """
+        Run a single try of WalkSAT from the given assignment, flipping it in place.
+
+        Shared by `solve` and `solve_with_stats`. Returns the iteration (counting from 1)
+        on which the assignment was found to satisfy the formula, or `None` if it still
+        doesn't after `max_flips` flips, or once the stop event is set.
+        """
+
+        # Up to three random draws, a clause lookup and a flip per iteration, all through locals.
+        clauses = self.reduced.clauses
+        choose_best_variable = self._choose_best_variable
+        counts = self.counts
+        # Random picks index with `rand()` directly: `random.choice` (and `randrange` even
+        # more so) spends most of its time checking its argument.
+        rand = self.rng.random
+        stopped = self._stopped
+        check_mask = self.STOP_CHECK_FLIPS - 1
+
+        counts.reset(self._to_mask(assignment))
+        unsat = counts.unsat # Kept up to date by `counts.flip`.
+
+        # Only flip as long as can flip.
+        for flip in range(max_flips):
+            # If there is no unsatisfied clause, we found a solution.
+            if not unsat:
+                return flip + 1
+
+            if not flip & check_mask and stopped():
+                return None
+
+            # Pick an unsatisfied clause randomly.
+            random_clause = clauses[unsat[int(rand() * len(unsat))]]
+
+            # With probability `noise_prob`, do random walk.
+            if rand() < noise_prob:
+                # Flip a random variable from the unsatisfied clause.
+                variables = random_clause.vars
+                var_to_flip = variables[int(rand() * len(variables))]
+            else:
+                # Greedy step: choose the variable with minimal break count.
+                var_to_flip = choose_best_variable(random_clause, assignment)
+
+            # Flip the chosen variable, wether random or greedy.
+            assignment[var_to_flip] ^= 1
+            counts.flip(var_to_flip, assignment[var_to_flip])
+
+        return None
 
     def solve(self, max_flips: int = 10000, max_restarts: int = 100, 
               noise_prob: float = 0.57) -> Tuple[Optional[List[Optional[bool]]], bool]:
@@ -118,37 +250,68 @@ class WalkSAT:
             Tuple of (assignment, found_solution).
         """
 
+        if self.unsatisfiable:
+            return None, False
+
+        cached = self._load_solution()
+        if cached is not None:
+            return cached, True
+
         # Only try as long as can restart.
         for restart in range(max_restarts):
+            if self._stopped():
+                break
+
             # Generate random assignment
-            assignment: List[Optional[bool]] = [None] * (self.formula.num_variables + 1)
-            for i in range(1, self.formula.num_variables + 1):
-                assignment[i] = random.choice([True, False])
-
-            # Only flip as long as can flip.
-            for flip in range(max_flips):
-                # Check if we found a solution.
-                if self.formula.is_satisfied(assignment):
-                    return assignment, True
-
-                # Get all unsatisfied clauses and pick one randomly.
-                unsatisfied_clauses = self.formula.get_unsatisfied_clauses(assignment)
-                random_clause = random.choice(unsatisfied_clauses)
-
-                # With probability `noise_prob`, do random walk.
-                if random.random() < noise_prob:
-                    # Flip a random variable from the unsatisfied clause.
-                    random_literal = random.choice(random_clause.literals)
-                    var_to_flip = abs(random_literal)
-                else:
-                    # Greedy step: choose the variable with minimal break count.
-                    var_to_flip = self._choose_best_variable(random_clause, assignment)
-
-                # Flip the chosen variable, wether random or greedy.
-                assignment[var_to_flip] = not assignment[var_to_flip]
+            assignment = self._random_assignment()
+
+            if self._walk(assignment, max_flips, noise_prob) is not None:
+                solution = self._to_list(assignment)
+                self._save_solution(solution)
+                return solution, True
 
         return None, False
 
+    def solve_parallel(self, max_flips: int = 10000, max_restarts: int = 100, noise_prob: float = 0.57,
+                       workers: Optional[int] = None) -> Tuple[Optional[List[Optional[bool]]], bool]:
+        """
+        Spread the restarts of `solve` over `workers` processes (all cores by default).
+
+        Restarts are independent, so each process runs its share of the `max_restarts`
+        with its own seed, derived from this solver's seed (see `best_of_runs`). As soon as
+        one finds a solution the others are told to stop (see `_walk`), and it returns
+        without waiting for them.
+        """
+
+        if self.unsatisfiable:
+            return None, False
+
+        cached = self._load_solution()
+        if cached is not None:
+            return cached, True
+
+        runs = max(1, min(max_restarts, workers or os.cpu_count() or 1))
+        # Each worker runs all its restarts in one job, so there is nothing queued to cancel:
+        # setting the stop event is what makes the ones still running give up (see `_walk`).
+        assignment, found_solution = best_of_runs(
+            partial(WalkSAT, self.formula),
+            [
+                {
+                    'max_flips': max_flips,
+                    # Share the restarts out evenly, the first ones take the remainder.
+                    'max_restarts': max_restarts // runs + (run < max_restarts % runs),
+                    'noise_prob': noise_prob
+                }
+                for run in range(runs)
+            ],
+            self.seed, runs,
+            key=lambda result: result[1], done=lambda result: result[1]
+        )
+
+        if found_solution:
+            self._save_solution(assignment)
+        return assignment, found_solution
+
     def solve_with_stats(self, max_flips: int = 10000, max_restarts: int = 100,
                         noise_prob: float = 0.57) -> dict:
         """Solve with detailed statistics, like number of restarts and flips."""
@@ -158,38 +321,44 @@ class WalkSAT:
             'assignment': None,
             'restarts_used': 0,
             'flips_used': 0,
-            'final_satisfied': 0
+            'final_satisfied': 0,
+            # Whether `Formula.simplify` showed no assignment works, see `__init__`.
+            'proved_unsat': False
         }
 
+        if self.unsatisfiable:
+            # Nothing was searched, so `final_satisfied` stays 0: no assignment to count on.
+            stats['proved_unsat'] = True
+            self.stats = stats
+            return stats
+
+        cached = self._load_solution()
+        if cached is not None:
+            stats.update({
+                'solution_found': True,
+                'assignment': cached,
+                'final_satisfied': len(self.formula.clauses)
+            })
+            return stats
+
         for restart in range(max_restarts):
-            assignment: List[Optional[bool]] = [None] * (self.formula.num_variables + 1)
-            for i in range(1, self.formula.num_variables + 1):
-                assignment[i] = random.choice([True, False])
-
-            for flip in range(max_flips):
-                if self.formula.is_satisfied(assignment):
-                    stats.update({
-                        'solution_found': True,
-                        'assignment': assignment,
-                        'restarts_used': restart + 1,
-                        'flips_used': flip + 1,
-                        'final_satisfied': len(self.formula.clauses)
-                    })
-                    return stats
-
-                unsatisfied_clauses = self.formula.get_unsatisfied_clauses(assignment)
-                random_clause = random.choice(unsatisfied_clauses)
-
-                if random.random() < noise_prob:
-                    random_literal = random.choice(random_clause.literals)
-                    var_to_flip = abs(random_literal)
-                else:
-                    var_to_flip = self._choose_best_variable(random_clause, assignment)
-
-                assignment[var_to_flip] = not assignment[var_to_flip]
+            assignment = self._random_assignment()
+
+            flips_used = self._walk(assignment, max_flips, noise_prob)
+            if flips_used is not None:
+                solution = self._to_list(assignment)
+                self._save_solution(solution)
+                stats.update({
+                    'solution_found': True,
+                    'assignment': solution,
+                    'restarts_used': restart + 1,
+                    'flips_used': flips_used,
+                    'final_satisfied': len(self.formula.clauses)
+                })
+                return stats
 
             stats['restarts_used'] = restart + 1
 
-        stats['final_satisfied'] = self.formula.count_satisfied(assignment)
+        stats['final_satisfied'] = self.formula.count_satisfied(self._to_mask(assignment))
         self.stats = stats
         return stats